@@ -5,7 +5,9 @@ You can override any arguments in SimpleArgumentParser like this:
 '''
 
 
+import os
 import random
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
@@ -34,18 +36,15 @@ NODE_ALGORITHM_CLASS_DICT = {
     'bfs-loops': node.NodeBFSLoops
 }
 
-def run_one_trial(args):
+def run_one_trial(args, print_stats=True):
     '''
     Function: run_one_trial
         Runs one trial (i.e. simulation) with the provided args (helpful when trying to quickly modify
-        args and seeing their results)
+        args and seeing their results). Set print_stats=False to skip printing the stats (e.g. when
+        running many trials).
 
     Returns: dictionary mapping of stats for printing
     '''
-    # Set seeds for debugging
-    # random.seed(a=43)
-    # np.random.seed(seed=43)
-
     num_nodes = args.num_nodes
     num_messages = args.num_messages
     max_steps = args.num_steps
@@ -57,13 +56,44 @@ def run_one_trial(args):
     topology_class = TOPOLOGY_CLASS_DICT[args.topology]
     topology = topology_class(num_nodes, args.density, args.volatility)
 
-    simulator = NetworkSimulator(node_class, topology, num_nodes)
+    simulator = NetworkSimulator(node_class, topology, num_nodes, args.vectorized)
     workload = workload_class(num_messages, num_nodes, ttl)
 
     simulator.initialize_new_workload(workload)
     simulator.run_workload(max_steps, args.graphics)
-    simulator.print_workload_cost_stats(args.verbose)
-    return simulator.compute_workload_stats()
+    if not print_stats:
+        return simulator.compute_workload_stats()
+    return simulator.print_workload_cost_stats(args.verbose)
+
+
+def seed_rngs(seed):
+    '''
+    Function: seed_rngs
+        Seeds both of the RNGs used by the simulator (`random` and `np.random`). A seed of None
+        draws fresh entropy from the OS.
+    '''
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def run_heatmap_trial(args, density, volatility, seed=None):
+    '''
+    Function: run_heatmap_trial
+        Runs one trial of the heatmap sweep at the given density and volatility. Trials share no state,
+        so this is safe to call from worker processes.
+
+        Each trial seeds its own RNGs, so results don't depend on which worker runs it (or on forked
+        workers inheriting the parent's RNG state).
+
+    Returns: dictionary mapping of stats, including the (rounded) density and volatility
+    '''
+    seed_rngs(seed)
+    args.density = density
+    args.volatility = volatility
+    stats = run_one_trial(args, print_stats=False)
+    stats['density'] = round(density, 4)
+    stats['volatility'] = round(volatility, 4)
+    return stats
 
 
 class SimpleArgumentParser(Tap):
@@ -85,30 +115,37 @@ class SimpleArgumentParser(Tap):
     metric: list = ['fraction_delivered']  # Which metric to use for the heatmap
 
     graphics: bool = False # whether to display a visualization of the network topology
+    vectorized: bool = False # whether to simulate flooding with the vectorized backend (alg='bfs' or 'bfs-ttl')
 
     heatmap: bool = False # whether to run multiple trials and construct a heatmap
+    num_workers: int = os.cpu_count() # number of processes to run heatmap trials on (1 = run serially)
     verbose: bool = False # whether to display more complex metrics
+    seed: int = None # seed for the RNGs, to make runs reproducible (None = unseeded)
 
 
 if __name__ == "__main__":
     args = SimpleArgumentParser().parse_args()
 
     if not args.heatmap:
+       seed_rngs(args.seed)
        run_one_trial(args)
        quit()
 
-    results = []
     n = 10
     b = 1.8
-    for density in b ** np.arange(-n, 1):
-        print(f"Density: {density}")
-        for volatility in b ** np.arange(-n, 1):
-            args.density = density
-            args.volatility = volatility
-            stats = run_one_trial(args)
-            stats['density'] = round(density, 4)
-            stats['volatility'] = round(volatility, 4)
-            results.append(stats)
+    param_list = [(density, volatility) for density in b ** np.arange(-n, 1) for volatility in b ** np.arange(-n, 1)]
+    # One independent seed per grid point, derived from args.seed
+    if args.seed is None:
+        seeds = [None] * len(param_list)
+    else:
+        seeds = [int(s) for s in np.random.SeedSequence(args.seed).generate_state(len(param_list))]
+    if args.num_workers > 1:
+        # Trials are independent, so run them across processes and keep the results in grid order
+        with ProcessPoolExecutor(max_workers=args.num_workers) as executor:
+            densities, volatilities = zip(*param_list)
+            results = list(executor.map(run_heatmap_trial, [args] * len(param_list), densities, volatilities, seeds))
+    else:
+        results = [run_heatmap_trial(args, d, v, seed) for (d, v), seed in zip(param_list, seeds)]
 
     for metric in args.metric:
         df = pd.DataFrame(results)
@@ -3,11 +3,41 @@ class Message:
     Message class. Contains the raw information that needs to be passed from the start node to the
         end node. Currently, the messages themselves contain no real valuable information (only routing
         deetails and cost metrics).
+
+        The cost metrics live in the parent Workload's per-message NumPy arrays (indexed by `id`), so
+        a Message is only a thin view onto its row of those arrays.
     '''
-    def __init__(self, id, start_id, destination_id) -> None:
+    __slots__ = ('id', 'start', 'destination_id', 'workload')
+
+    def __init__(self, id, start_id, destination_id, workload) -> None:
         self.id = id        # Integer id of the message
         self.start = start_id       # Integer id of the start node
         self.destination_id = destination_id    # Integer id of the destination node
-        self.total_cost = 0     # Cumulative sum of "hops" for this message to be delivered
-        self.delivered = False     # Whether the message has been delivered or not
-        self.num_packets = 0    # Number of packets per message
\ No newline at end of file
+        self.workload = workload    # Workload that owns the per-message stat arrays
+
+    @property
+    def total_cost(self):
+        '''Cumulative sum of "hops" for this message to be delivered'''
+        return self.workload.total_cost[self.id]
+
+    @total_cost.setter
+    def total_cost(self, value):
+        self.workload.total_cost[self.id] = value
+
+    @property
+    def delivered(self):
+        '''Whether the message has been delivered or not'''
+        return self.workload.delivered[self.id]
+
+    @delivered.setter
+    def delivered(self, value):
+        self.workload.delivered[self.id] = value
+
+    @property
+    def num_packets(self):
+        '''Number of packets per message'''
+        return self.workload.num_packets[self.id]
+
+    @num_packets.setter
+    def num_packets(self, value):
+        self.workload.num_packets[self.id] = value
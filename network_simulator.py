@@ -1,6 +1,7 @@
 
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
+import numpy as np
 from time import sleep
 from typing import List, Type
 
@@ -10,6 +11,19 @@ from message import Message
 from packet import Packet
 from topology import Topology  # choose your topology
 
+
+def bump_counters(num_packets, msg_ids, inbox_totals, node_ids, inbox_lens):
+    '''
+    Function: bump_counters
+        Adds one timestep's worth of bookkeeping to the running counters in a single vectorized update:
+            - one packet for every message id in `msg_ids` (repeats allowed)
+            - each node's current inbox length (`inbox_lens`, for the distinct `node_ids`) to its
+              cumulative inbox total
+    '''
+    num_packets += np.bincount(np.asarray(msg_ids, dtype=np.int64), minlength=num_packets.size)
+    inbox_totals[np.asarray(node_ids, dtype=np.int64)] += np.asarray(inbox_lens, dtype=np.int64)
+
+
 class NetworkSimulator:
     '''Implements as simple simulator for a network with changing topology.
 
@@ -21,22 +35,64 @@ class NetworkSimulator:
         simulator.run_workload(max_steps)
         print(simulator.compute_workload_cost())
 
+    Flooding node classes (those with `supports_vectorized_flood`) can instead be simulated for all
+    nodes and messages at once with `vectorized=True` (see run_one_flood_step).
     '''
   
-    def __init__(self, node_class: Type[Node], topology: Topology, num_nodes) -> None:
+    def __init__(self, node_class: Type[Node], topology: Topology, num_nodes, vectorized: bool=False) -> None:
+        if vectorized and not node_class.supports_vectorized_flood:
+            raise ValueError(f'{node_class.__name__} does not support the vectorized flooding backend')
+        self.vectorized = vectorized    # Whether to use the vectorized flooding backend instead of per-packet routing
+        self.flood_uses_ttl = node_class.vectorized_flood_uses_ttl     # Whether the flooding backend drops packets by TTL
         self.nodelist = [node_class(i) for i in range(num_nodes)]   # List of node objects in our network
         self.topology = topology    # Topology of the network
         self.current_workload = None    # Workload of packets we want to deliver
+        self.inbox_totals = np.zeros(num_nodes, dtype=np.int64)    # Cumulative inbox length of each node
+        self.num_steps_run = 0     # Number of timesteps run (used to calculate the average inbox load)
+        self._step_msg_ids = []     # Message ids of the packets handled during the current timestep
+        self._pending_packets = []      # Packets sent during the current timestep, in send order
+        self._pending_hop_ids = []      # Next hop id of each packet in _pending_packets
+        self._active_nodes = set()      # Ids of the nodes with a nonempty inbox
+        # State of the vectorized flooding backend, as [num_nodes, num_messages] arrays
+        self._flood_inbox = None    # Number of packets of each message in each node's inbox
+        self._flood_visited = None  # Whether each node has received each message
+        self._flood_destinations = None     # Destination node id of each message
+        self._flood_steps = 0   # Timesteps since the workload started (= hops taken by every packet in flight)
     
     def initialize_new_workload(self, workload) -> None:
-        '''Adds all messages to the inbox of their respective start nodes.'''
+        '''Adds all messages to the inbox of their respective start nodes.
+
+        The initial packets come from Packet's free list, and packets left over from the previous
+        workload are released back to it, so running many workloads on one simulator doesn't
+        reallocate a packet per message each time.
+        '''
         print(f'Initializing workload with {len(workload.messages)} messages.')
         self.current_workload = workload
         for node in self.nodelist:
             node.set_workload(workload)
+            # drop any packets left over from the previous workload
+            for packet in node.inbox:
+                packet.release()
+            node.inbox.clear()
+            node.outbox.clear()
+        if self.vectorized:
+            self.initialize_flood(workload)
+            return
         for message in workload.messages:
-            packet = Packet(message, workload.ttl)
-            self.nodelist[message.start].inbox.append(packet)
+            self.nodelist[message.start].inbox.append(Packet.acquire(message, workload.ttl))
+        self._active_nodes = set(workload.start_ids.tolist())
+
+    def initialize_flood(self, workload) -> None:
+        '''Places one packet of every message in the inbox of its start node, for the vectorized flooding backend.'''
+        message_ids = np.arange(workload.num_messages)
+        starts = workload.start_ids
+        self._flood_destinations = workload.destination_ids
+        self._flood_visited = np.zeros((len(self.nodelist), workload.num_messages), dtype=bool)
+        # a node gets at most one packet per neighbor per timestep, so the smallest type holding num_nodes will do
+        count_dtype = np.min_scalar_type(len(self.nodelist))
+        self._flood_inbox = np.zeros((len(self.nodelist), workload.num_messages), dtype=count_dtype)
+        self._flood_inbox[starts, message_ids] = 1
+        self._flood_steps = 0
         
     def run_workload(self, max_steps=100, graphics: bool=False):
         '''
@@ -44,21 +100,36 @@ class NetworkSimulator:
             Runs a workload for max_steps. Performs one step on the network and updates the topology.
         '''
         print(f'Running workload for {max_steps} steps.') 
-        # if graphics: 
-        #     print('Graphics enabled!')
-        #     fig = plt.figure() 
-        #     ani = animation.FuncAnimation(fig, self.topology.display, interval=100, fargs=(fig,plt)) 
-        #     plt.show() 
+        # Pick the loop once rather than checking for graphics on every step
+        if graphics:
+            self._run_with_graphics(max_steps)
+        else:
+            self._run_headless(max_steps)
+
+    def _run_headless(self, max_steps):
+        '''
+        Function: _run_headless
+            Runs max_steps steps of the network and topology with no visualization.
+        '''
+        for _ in range(max_steps):
+            self.run_one_network_step()
+            self.topology.step()
+
+    def _run_with_graphics(self, max_steps):
+        '''
+        Function: _run_with_graphics
+            Runs max_steps steps of the network and topology, displaying the topology after every step.
+        '''
+        # print('Graphics enabled!')
+        # fig = plt.figure() 
+        # ani = animation.FuncAnimation(fig, self.topology.display, interval=100, fargs=(fig,plt)) 
+        # plt.show() 
         for _ in range(max_steps):
             # perform one step on network 
             self.run_one_network_step()
-                # if graphics: 
-                #     self.display() 
             # topology update
             self.topology.step()
-            if graphics: 
-                self.topology.display()
-            #       # self.display() # redo display after topology display
+            self.topology.display()
 
     def display(self): 
         pass
@@ -73,10 +144,10 @@ class NetworkSimulator:
 
         Returns a dictionary of {average, minimum, peak} number of packets in inboxes of nodes
         '''
-        inbox_stats_per_node = [node.avg_num_packets_inbox / node.steps for node in self.nodelist]
-        average_num_packets_inbox = sum(inbox_stats_per_node) / len(self.nodelist)
-        low_num_packets_inbox = min(inbox_stats_per_node)
-        high_num_packets_inbox = max(inbox_stats_per_node)
+        inbox_stats_per_node = self.inbox_totals / self.num_steps_run
+        average_num_packets_inbox = float(inbox_stats_per_node.mean())
+        low_num_packets_inbox = float(inbox_stats_per_node.min())
+        high_num_packets_inbox = float(inbox_stats_per_node.max())
         inbox_stats = {
             'average_num_packets_inbox': average_num_packets_inbox,
             'low_num_packets_inbox': low_num_packets_inbox,
@@ -91,10 +162,7 @@ class NetworkSimulator:
 
         Returns a number representing the total workload cost.
         '''
-        workload_cost = 0
-        for message in self.current_workload.messages:
-            workload_cost += message.total_cost
-        return workload_cost
+        return int(self.current_workload.total_cost.sum())
 
     def compute_packets_per_message(self):
         '''
@@ -103,11 +171,7 @@ class NetworkSimulator:
 
         Returns a number representing the average packets per message.
         '''
-        average_packets_per_message = 0
-        for message in self.current_workload.messages:
-            average_packets_per_message += message.num_packets
-        average_packets_per_message /= len(self.current_workload.messages)
-        return average_packets_per_message
+        return float(self.current_workload.num_packets.mean())
     
     def compute_workload_stats(self):
         '''
@@ -116,9 +180,12 @@ class NetworkSimulator:
 
         Returns an indexable dictionary of various workload-related stats.
         '''
+        # Every stat is a single reduction over the workload's per-message arrays
+        # or the simulator's per-node inbox counters
+        workload = self.current_workload
         workload_cost = self.compute_workload_cost()
-        cost_per_message = workload_cost / self.current_workload.num_messages
-        fraction_delivered = self.current_workload.num_delivered() / self.current_workload.num_messages
+        cost_per_message = workload_cost / workload.num_messages
+        fraction_delivered = workload.num_delivered() / workload.num_messages
         inbox_stats = self.compute_inbox_stats()
         average_packets_per_message = self.compute_packets_per_message()
         stats = {
@@ -134,6 +201,8 @@ class NetworkSimulator:
         '''
         Function: print_workload_cost_stats
             Prints to console the workload stats.
+
+        Returns the stats dictionary that was printed, so callers don't need to compute it again.
         '''
         stats = self.compute_workload_stats()
         print("Total cost:", stats['workload_cost'])
@@ -145,49 +214,109 @@ class NetworkSimulator:
             print(f"Peak number of packets across nodes:", stats['inbox_stats']['high_num_packets_inbox'])
             print(f"Average number of packets per message:", stats['average_packets_per_message'])
         print('-'*25)
+        return stats
     
     def run_one_network_step(self):
         '''
         Function: run_one_network_step
-            Runs a single timestep and processes the outbox of nodes.
+            Runs a single timestep and processes the outbox of nodes. Only nodes with a nonempty inbox
+            are visited (in id order); every other node has nothing to do this timestep.
         '''
-        for node in self.nodelist:
+        if self.vectorized:
+            self.run_one_flood_step()
+            return
+        active_ids = sorted(self._active_nodes)
+        active_nodes = [self.nodelist[node_id] for node_id in active_ids]
+        inbox_lens = [len(node.inbox) for node in active_nodes]
+        self._step_msg_ids = []
+        for node in active_nodes:
             self.run_one_node_step(node)
-        for node in self.nodelist:
-            self.outbox_all_packets(node)
+        # per-message and per-node accounting for the whole timestep at once
+        bump_counters(self.current_workload.num_packets, self._step_msg_ids, self.inbox_totals, active_ids, inbox_lens)
+        self.num_steps_run += 1
+        self.outbox_all_packets()
     
+    def run_one_flood_step(self):
+        '''
+        Function: run_one_flood_step
+            Vectorized equivalent of run_one_network_step for flooding nodes (NodeNaiveBFS). Tracks how
+            many packets of each message are in each node's inbox and advances all of them at once with
+            a single adjacency matrix product:
+                - a node that receives a message for the first time forwards it to every neighbor that
+                  hasn't received it yet, unless it is the message's destination
+                - later packets of the message are dropped (like NodeNaiveBFS's seen messages)
+                - for TTL flooding (NodeBFSWithTTL), nothing is forwarded once packets run out of TTL.
+                  Every packet in flight was injected at the start of the workload and moves one hop
+                  per timestep, so all of them have the same TTL left at a given timestep.
+
+            Every message reaches every node at the same timestep as with per-packet routing, so the
+            delivered messages are the same. The cost and packet counts leave out packets sent to nodes
+            that already had the message, which per-packet flooding sends only for them to be dropped.
+        '''
+        workload = self.current_workload
+        inbox = self._flood_inbox
+        received = inbox > 0
+        workload.num_packets += inbox.sum(axis=0, dtype=np.int64)
+        self.inbox_totals += inbox.sum(axis=1, dtype=np.int64)
+        self.num_steps_run += 1
+
+        message_ids = np.arange(workload.num_messages)
+        workload.delivered |= received[self._flood_destinations, message_ids]
+        frontier = received & ~self._flood_visited
+        frontier[self._flood_destinations, message_ids] = False
+        self._flood_visited |= received
+        self._flood_steps += 1
+        if self.flood_uses_ttl and workload.ttl - self._flood_steps <= 0:
+            frontier[:] = False
+
+        # float32 so the product goes through BLAS; the counts are small integers, so they're exact
+        adjacency = self.topology.topology.astype(np.float32)
+        np.fill_diagonal(adjacency, 0)
+        arrivals = (adjacency @ frontier.astype(np.float32)).astype(inbox.dtype)
+        arrivals[self._flood_visited] = 0
+        workload.total_cost += arrivals.sum(axis=0, dtype=np.int64)
+        self._flood_inbox = arrivals
+
     def run_one_node_step(self, node: Node):
         '''
         Function: run_one_node_step
             Processes each packet in a node's inbox by:
                 (1) Deciding which node to send the packet to
                 (2) Computing various workload-related metrics for each send
+            The node's outbox is then moved onto the simulator's pending sends, which are delivered
+            once every node has run (see outbox_all_packets).
         '''
         for packet in node.inbox:
+            # record the message so its packet count is incremented at the end of the timestep
+            # (before handling, which may release the packet)
+            self._step_msg_ids.append(packet.message.id)
             # Node handles this logic, including:
             # - Deciding which node to send the message to
             # - Retries after failed sends
             # - Computing the cost of each send
             # - Marking messages as delivered
             node.handle_packet(packet, self.topology)
-            # increment the number of packets per message in the workload
-            message_index = packet.message.id
-            self.current_workload.messages[message_index].num_packets += 1
-        # calculate average number of packets in the inbox of each node
-        node.avg_num_packets_inbox += len(node.inbox)
-        node.steps += 1
-        # Clear inbox after loop 
-        node.inbox = []
+        # Clear inbox after loop (in place, so no new deque is allocated every timestep)
+        node.inbox.clear()
+        # Drain the outbox while the node is at hand, rather than walking every node again later
+        self._pending_packets.extend(packet for packet, _ in node.outbox)
+        self._pending_hop_ids.extend(next_hop_id for _, next_hop_id in node.outbox)
+        node.outbox.clear()
         return
 
-    def outbox_all_packets(self, node: Node):
+    def outbox_all_packets(self):
         '''
         Function: outbox_all_packets
-            Processes the outbox of all packets.
-        '''
-        for packet, next_hop_id in node.outbox:
-            # Place packets to next hop's inbox
-            self.nodelist[next_hop_id].inbox.append(packet)
-        # Then remove from outbox
-        node.outbox = []
-        return 
+            Delivers the packets sent this timestep, which run_one_node_step drains from the outbox of
+            each node that ran, appending each packet to its next hop's inbox in send order.
+
+            The nodes that received packets become the active nodes for the next timestep.
+        '''
+        nodelist = self.nodelist
+        # Place packets to next hops' inboxes
+        for packet, next_hop_id in zip(self._pending_packets, self._pending_hop_ids):
+            nodelist[next_hop_id].inbox.append(packet)
+        self._active_nodes = set(self._pending_hop_ids)
+        self._pending_packets = []
+        self._pending_hop_ids = []
+        return
@@ -1,6 +1,7 @@
 
 from abc import ABC, abstractmethod
-from typing import List, Iterator, Tuple
+from collections import deque
+from typing import List, Iterator, Optional, Tuple
 import random
 
 from message import Message
@@ -8,27 +9,52 @@ from packet import Packet
 from topology import Topology
 from workload import Workload
 
+def iter_shuffled(items: list) -> Iterator:
+    '''
+    Function: iter_shuffled
+        Yields the elements of items in a uniformly random order, shuffling items in place one position
+            per element yielded (a partial Fisher-Yates shuffle). A caller that stops early doesn't pay for
+            shuffling the elements it never reached.
+    '''
+    n = len(items)
+    for i in range(n):
+        j = random.randrange(i, n)
+        items[i], items[j] = items[j], items[i]
+        yield items[i]
+
+
 class Node(ABC):
     '''
     Node class. Handles receiving and sending of messages for individual nodes.
         Extend this class to test forwarding algorithms.
     '''
+    supports_vectorized_flood = False   # whether NetworkSimulator(vectorized=True) can simulate this class
+    vectorized_flood_uses_ttl = False   # whether the vectorized flooding backend should drop packets by TTL
+    remembers_seen_messages = False     # whether set_workload should give the node a seen_messages table
+    tracks_forwarded_by = False     # whether set_workload should give the workload a shared forwarded_by table
+
     def __init__(self, self_id) -> None:
         # self.nodelist = nodelist
-        self.inbox  = []     #  messages sent to node
-        self.outbox = []    #  only put in outbox if "successful send"
+        self.inbox  = deque()     #  messages sent to node
+        self.outbox = deque()    #  only put in outbox if "successful send"
         self.self_id = self_id      #  `self_id` is position of node in parent NetworkSimulator's nodelist. Used for identification  
-        self.avg_num_packets_inbox = 0  # used to calculate the average inbox load
-        self.steps = 0      # used to calculate the average inbox load (keeps track of number of timesteps)
 
     '''
     Function: set_workload
         Allows nodes to retreive information about the current workload running.
         For instance, nodes may wish to set different parameters based on the
         size of the current network
+
+        Nodes that remember seen messages get a fresh seen_messages table with one byte per message id
+        (1 once the message has passed through the node). Nodes that track forwarders make sure the
+        workload has a forwarded_by table, shared by all nodes, with one bitmask per message id.
     '''
     def set_workload(self, workload: Workload):
         self.workload = workload
+        if self.remembers_seen_messages:
+            self.seen_messages = bytearray(workload.num_messages)
+        if self.tracks_forwarded_by and workload.forwarded_by is None:
+            workload.forwarded_by = [0] * workload.num_messages
 
     '''
     Function: handle_packet
@@ -38,6 +64,7 @@ class Node(ABC):
         - Uses topology of network to find who node can talk to (simulating node querying its reachable network)
         - Allows sending_algorithm handle routing and cost calculations
         - Places (next_packet, next_node) pairs into outbox
+        - Releases the packet for reuse (see Packet.acquire) unless it was forwarded as is
 
         Returns number of forwards (i.e. packet sending/ forwarding). 
             >0 if forwards occur. 
@@ -45,27 +72,31 @@ class Node(ABC):
             -1 if self is destination.
     '''
     def handle_packet(self, packet: Packet, topology: Topology) -> int:
-        # prevent packets from looping
-        packet.nodes_visited.append(self)
         msg = packet.message
         # check if self is destination
         destination = msg.destination_id
         if destination == self.self_id:
-            msg.delivered = True
+            self.workload.delivered[msg.id] = True
+            packet.release()
             return -1
-        # search topology for self's connections. 
-        neighbors = topology.topology[self.self_id].nonzero()
-        neighbors = neighbors[0] # Unpack.
+        # prevent packets from looping (only packets that may be forwarded need the mark)
+        packet.visited_mask |= 1 << self.self_id
+        # search topology for self's connections (as Python ints, for the visited bitmask checks)
+        neighbors = topology.get_neighbor_ids(self.self_id)
 
-        forwards = 0 # count of how many nodes self forwards msg to
         # DO ALGORITHM to send messages according to logic 
             # who to send to
             # increment cost
-        for forward_packet, forward_node in self.sending_algorithm(packet, neighbors):
-            self.outbox.append((forward_packet, forward_node))
-            forwards += 1
-
-        return forwards
+        sends = self.sending_algorithm(packet, neighbors)
+        if not isinstance(sends, list):
+            # sending algorithms written as generators still work
+            sends = list(sends)
+        self.outbox.extend(sends)
+
+        # packet itself (rather than a copy) may still be in transit; if so, it is the first send
+        if not sends or sends[0][0] is not packet:
+            packet.release()
+        return len(sends) # count of how many nodes self forwards msg to
         # let network_simulator handle message deletion from inbox & outbox
 
 
@@ -77,10 +108,15 @@ class Node(ABC):
             # - Retry after failed sends
             # - Compute the cost of each send
 
-        Yields (node, msg) pairs to send OR returns a list of (node, msg) pairs.
+        Returns a list of (packet, next_node_id) pairs to send. Building the whole list at once lets
+            handle_packet extend the outbox in one call (an iterator of pairs is also accepted, and is
+            turned into a list).
+
+            If the incoming packet itself is forwarded rather than a copy (see Packet.acquire), it must be
+            the first pair; otherwise handle_packet releases it for reuse while it is still in transit.
     '''
     @abstractmethod
-    def sending_algorithm(self, packet, neighbors):
+    def sending_algorithm(self, packet, neighbors) -> List[Tuple[Packet, int]]:
         pass
 
 
@@ -88,32 +124,42 @@ class NodeNaiveBFS(Node):
     '''
     NodeNaiveBFS class (extends Node class). Forwards a packet to every neighbor.
         - Has some optimizations with keeping a past history of messages the node has seen.
+        - Can be simulated by NetworkSimulator's vectorized flooding backend, which bypasses this class's
+          per-packet methods entirely.
     '''
-    def __init__(self, self_id, inbox: List[Packet] = [], outbox: List[Tuple[Packet, Node]] = []) -> None:
+    supports_vectorized_flood = True
+    remembers_seen_messages = True
+
+    def __init__(self, self_id, inbox: Optional[List[Packet]] = None, outbox: Optional[List[Tuple[Packet, Node]]] = None) -> None:
         super().__init__(self_id)
-        self.inbox = inbox[:]  # messages sent to node
-        self.outbox = outbox[:]  # only put in outbox if "successful send"
-        self.seen_messages = set() # previously seen messages
+        self.inbox = deque(inbox or ())  # messages sent to node
+        self.outbox = deque(outbox or ())  # only put in outbox if "successful send"
+        self.seen_messages = bytearray() # previously seen messages, by message id (sized by set_workload)
 
-    def sending_algorithm(self, packet: Packet, neighbors: List[Node]) -> Iterator[Tuple[Node, Packet]]:
+    def sending_algorithm(self, packet: Packet, neighbors: List[Node]) -> List[Tuple[Packet, int]]:
         # maintain a memory of past messages the node has seen to prevent a packet from going to 
         # i.e. A -> B; A -> C -> B
-        if packet.message in self.seen_messages:
-            return
-        self.seen_messages.add(packet.message)
+        message_id = packet.message.id
+        if self.seen_messages[message_id]:
+            return []
+        self.seen_messages[message_id] = 1
 
+        sends = []
         for forward_node in neighbors:
             # don't forward packets to nodes that we've already visited
-            if forward_node in packet.nodes_visited:
+            if (packet.visited_mask >> forward_node) & 1:
                 continue
-            # construct a new copy of a packet
-            # forward_packet = copy.copy(packet)
-            forward_packet = Packet(packet.message)
-            forward_packet.nodes_visited = packet.nodes_visited
-            forward_packet.message.total_cost += 1
-            forward_packet.nodes_visited.append(self.self_id)
-            yield (forward_packet, forward_node)
-        return
+            # the first send reuses the incoming packet; only further sends need a new copy
+            if sends:
+                # forward_packet = copy.copy(packet)
+                forward_packet = Packet.acquire(packet.message)
+                forward_packet.visited_mask = packet.visited_mask
+            else:
+                forward_packet = packet
+            sends.append((forward_packet, forward_node))
+        # every send costs one hop; charge them all at once rather than per neighbor
+        self.workload.total_cost[packet.message.id] += len(sends)
+        return sends
 
 
 class RandomForwardNode(Node):
@@ -124,54 +170,62 @@ class RandomForwardNode(Node):
     def __init__(self, self_id):
         super().__init__(self_id)
 
-    def sending_algorithm(self, packet: Packet, neighbors: List[Node]) -> Iterator[Tuple[Node, Packet]]:
+    def sending_algorithm(self, packet: Packet, neighbors: List[Node]) -> List[Tuple[Packet, int]]:
         if len(neighbors) == 0:
-            return
+            return []
         else:
             # TODO: Try forwarding the node to more than neighbor
             # i.e. k=2 or k=3
             forward_node = random.choice(neighbors)
-            packet.message.total_cost += 1
-            packet.nodes_visited.append(self.self_id)
-            yield (packet, forward_node)
-        return
+            self.workload.total_cost[packet.message.id] += 1
+            return [(packet, forward_node)]
 
 class NodeBFSWithTTL(Node):
     '''
     NodeBFSWithTTL class (extends Node class). Copy of the NodeNaiveBFS algorithm but with a TTL added to each packet
         Every node decrements the TTL by 1. If the TTL reaches 0, the packet is dropped.
         This prevents packets from being routed forever.
+        - Can be simulated by NetworkSimulator's vectorized flooding backend, which bypasses this class's
+          per-packet methods entirely.
     '''
-    def __init__(self, self_id, inbox: List[Packet] = [], outbox: List[Tuple[Packet, Node]] = []) -> None:
+    supports_vectorized_flood = True
+    vectorized_flood_uses_ttl = True
+    remembers_seen_messages = True
+
+    def __init__(self, self_id, inbox: Optional[List[Packet]] = None, outbox: Optional[List[Tuple[Packet, Node]]] = None) -> None:
         super().__init__(self_id)
-        self.inbox = inbox[:]  # messages sent to node
-        self.outbox = outbox[:]  # only put in outbox if "successful send"
-        self.seen_messages = set() # previously seen messages
+        self.inbox = deque(inbox or ())  # messages sent to node
+        self.outbox = deque(outbox or ())  # only put in outbox if "successful send"
+        self.seen_messages = bytearray() # previously seen messages, by message id (sized by set_workload)
 
-    def sending_algorithm(self, packet: Packet, neighbors: List[Node]) -> Iterator[Tuple[Node, Packet]]:
+    def sending_algorithm(self, packet: Packet, neighbors: List[Node]) -> List[Tuple[Packet, int]]:
         # maintain a memory of past messages the node has seen to prevent a packet from going to 
         # i.e. A -> B; A -> C -> B
-        if packet.message in self.seen_messages:
-            return
-        self.seen_messages.add(packet.message)
+        message_id = packet.message.id
+        if self.seen_messages[message_id]:
+            return []
+        self.seen_messages[message_id] = 1
 
         # drop packets that have been routed too often
         packet.ttl -= 1
         if packet.ttl <= 0:
-            return
+            return []
 
+        sends = []
         for forward_node in neighbors:
             # don't forward packets to nodes that we've already visited
-            if forward_node in packet.nodes_visited:
+            if (packet.visited_mask >> forward_node) & 1:
                 continue
-            # construct a new copy of a packet
-            # forward_packet = copy.copy(packet)
-            forward_packet = Packet(packet.message, packet.ttl)
-            forward_packet.nodes_visited = packet.nodes_visited
-            forward_packet.message.total_cost += 1
-            forward_packet.nodes_visited.append(self.self_id)
-            yield (forward_packet, forward_node)
-        return
+            # the first send reuses the incoming packet; only further sends need a new copy
+            if sends:
+                # forward_packet = copy.copy(packet)
+                forward_packet = Packet.acquire(packet.message, packet.ttl)
+                forward_packet.visited_mask = packet.visited_mask
+            else:
+                forward_packet = packet
+            sends.append((forward_packet, forward_node))
+        self.workload.total_cost[packet.message.id] += len(sends)
+        return sends
 
 
 class NodeBFSWithTTLEarlySplit(Node):
@@ -180,47 +234,62 @@ class NodeBFSWithTTLEarlySplit(Node):
         often. Forwards packets it receives as a fraction of (current TTL of the packet / starting TTL of packets).
         Intuitively, this means that packets are duplicated more often towards the start of their journey.
     '''
+    remembers_seen_messages = True
+
     def __init__(self,
                  self_id,
                  workload: Workload = None, # These nodes (and maybe all nodes) need info from the workload
-                 inbox: List[Packet] = [],
-                 outbox: List[Tuple[Packet, Node]] = []) -> None:
+                 inbox: Optional[List[Packet]] = None,
+                 outbox: Optional[List[Tuple[Packet, Node]]] = None) -> None:
         super().__init__(self_id)
-        self.inbox = inbox[:]  # messages sent to node
-        self.outbox = outbox[:]  # only put in outbox if "successful send"
-        self.seen_messages = set() # previously seen messages
+        self.inbox = deque(inbox or ())  # messages sent to node
+        self.outbox = deque(outbox or ())  # only put in outbox if "successful send"
+        self.seen_messages = bytearray() # previously seen messages, by message id (sized by set_workload)
         self.workload = workload
+        if workload is not None:
+            self.set_workload(workload)
 
-    def sending_algorithm(self, packet: Packet, neighbors: List[Node]) -> Iterator[Tuple[Node, Packet]]:
+    def sending_algorithm(self, packet: Packet, neighbors: List[Node]) -> List[Tuple[Packet, int]]:
         # maintain a memory of past messages the node has seen to prevent a packet from going to 
         # i.e. A -> B; A -> C -> B
-        if packet.message in self.seen_messages:
-            return
-        self.seen_messages.add(packet.message)
+        message_id = packet.message.id
+        if self.seen_messages[message_id]:
+            return []
+        self.seen_messages[message_id] = 1
 
         # drop packets that have been routed too often
         packet.ttl -= 1
         if packet.ttl <= 0:
-            return
+            return []
 
+        sends = []
         nodes_sent = 0
-        random.shuffle(neighbors) # randomly choose which fraction to send to
-        for forward_node in neighbors:
+        ttl_x_degree = packet.ttl * len(neighbors)
+        num_messages = self.workload.num_messages
+        # randomly choose which fraction to send to, shuffling a copy (neighbors is shared by the
+        # topology) only as far as we get through it
+        for forward_node in iter_shuffled(list(neighbors)):
             # don't forward packets to nodes that we've already visited
-            if forward_node in packet.nodes_visited:
+            if (packet.visited_mask >> forward_node) & 1:
                 continue
 
             # If the packet has been out for a while, send it to fewer neighbors
-            if packet.ttl / self.workload.num_messages >= nodes_sent / len(neighbors):
-                # construct a new copy of a packet
-                # forward_packet = copy.copy(packet)
-                forward_packet = Packet(packet.message, packet.ttl)
-                forward_packet.nodes_visited = packet.nodes_visited
-                forward_packet.message.total_cost += 1
-                forward_packet.nodes_visited.append(self.self_id)
-                yield (forward_packet, forward_node)
+            # (ttl / num_messages >= nodes_sent / len(neighbors), cross-multiplied to stay in ints)
+            if ttl_x_degree >= nodes_sent * num_messages:
+                # the first send reuses the incoming packet; only further sends need a new copy
+                if sends:
+                    # forward_packet = copy.copy(packet)
+                    forward_packet = Packet.acquire(packet.message, packet.ttl)
+                    forward_packet.visited_mask = packet.visited_mask
+                else:
+                    forward_packet = packet
+                sends.append((forward_packet, forward_node))
                 nodes_sent += 1
-        return
+            else:
+                # nodes_sent only changes when a packet is sent, so no later neighbor passes the check either
+                break
+        self.workload.total_cost[packet.message.id] += nodes_sent
+        return sends
 
 
 class NodeBFSWithTTLLateSplit(Node):
@@ -229,69 +298,96 @@ class NodeBFSWithTTLLateSplit(Node):
         often. Forwards packets it receives as a fraction of (starting TTL of packets / current TTL of the packet).
         Intuitively, this means that packets are duplicated more often towards the start of their journey.
     '''
+    remembers_seen_messages = True
+
     def __init__(self,
                  self_id,
                  workload: Workload = None, # These nodes (and maybe all nodes) need info from the workload
-                 inbox: List[Packet] = [],
-                 outbox: List[Tuple[Packet, Node]] = []) -> None:
+                 inbox: Optional[List[Packet]] = None,
+                 outbox: Optional[List[Tuple[Packet, Node]]] = None) -> None:
         super().__init__(self_id)
-        self.inbox = inbox[:]  # messages sent to node
-        self.outbox = outbox[:]  # only put in outbox if "successful send"
-        self.seen_messages = set() # previously seen messages
+        self.inbox = deque(inbox or ())  # messages sent to node
+        self.outbox = deque(outbox or ())  # only put in outbox if "successful send"
+        self.seen_messages = bytearray() # previously seen messages, by message id (sized by set_workload)
         self.workload = workload # workload of messages to be delivered
+        if workload is not None:
+            self.set_workload(workload)
 
-    def sending_algorithm(self, packet: Packet, neighbors: List[Node]) -> Iterator[Tuple[Node, Packet]]:
+    def sending_algorithm(self, packet: Packet, neighbors: List[Node]) -> List[Tuple[Packet, int]]:
         # maintain a memory of past messages the node has seen to prevent a packet from going to 
         # i.e. A -> B; A -> C -> B
-        if packet.message in self.seen_messages:
-            return
-        self.seen_messages.add(packet.message)
+        message_id = packet.message.id
+        if self.seen_messages[message_id]:
+            return []
+        self.seen_messages[message_id] = 1
 
         # drop packets that have been routed too often
         packet.ttl -= 1
         if packet.ttl <= 0:
-            return
+            return []
 
+        sends = []
         nodes_sent = 0
-        random.shuffle(neighbors)
-        for forward_node in neighbors:
+        ttl_x_degree = packet.ttl * len(neighbors)
+        num_messages = self.workload.num_messages
+        # neighbors is shared by the topology, so shuffle a copy
+        for forward_node in iter_shuffled(list(neighbors)):
             # don't forward packets to nodes that we've already visited
-            if forward_node in packet.nodes_visited:
+            if (packet.visited_mask >> forward_node) & 1:
                 continue
 
             # If the packet has been out for a while, send it to fewer neighbors
-            if nodes_sent ==0 or packet.ttl / self.workload.num_messages <= nodes_sent / len(neighbors):
-                # construct a new copy of a packet
-                # forward_packet = copy.copy(packet)
-                forward_packet = Packet(packet.message, packet.ttl)
-                forward_packet.nodes_visited = packet.nodes_visited
-                forward_packet.message.total_cost += 1
-                forward_packet.nodes_visited.append(self.self_id)
-                yield (forward_packet, forward_node)
+            # (ttl / num_messages <= nodes_sent / len(neighbors), cross-multiplied to stay in ints)
+            if nodes_sent ==0 or ttl_x_degree <= nodes_sent * num_messages:
+                # the first send reuses the incoming packet; only further sends need a new copy
+                if sends:
+                    # forward_packet = copy.copy(packet)
+                    forward_packet = Packet.acquire(packet.message, packet.ttl)
+                    forward_packet.visited_mask = packet.visited_mask
+                else:
+                    forward_packet = packet
+                sends.append((forward_packet, forward_node))
                 nodes_sent += 1
-        return
+            else:
+                # nodes_sent only changes when a packet is sent, so no later neighbor passes the check either
+                break
+        self.workload.total_cost[packet.message.id] += nodes_sent
+        return sends
 
 
 class NodeBFSLoops(Node):
     '''
     NodeBFSLoops class (extends Node class). Nodes will not forward on packets containing messages that they
         have already seen. Allows for a message to be forwarded through the same node multiple times.
+
+        Nodes that have already forwarded a message are skipped for every packet of that message (the
+        workload's forwarded_by mask), not just the packet's own path, which keeps the flood bounded.
     '''
-    def __init__(self, self_id, inbox: List[Packet] = [], outbox: List[Tuple[Packet, Node]] = []) -> None:
-        super().__init__(self_id)
-        self.inbox = inbox[:]  # messages sent to node
-        self.outbox = outbox[:]  # only put in outbox if "successful send"
+    tracks_forwarded_by = True
 
-    def sending_algorithm(self, packet: Packet, neighbors: List[Node]) -> Iterator[Tuple[Node, Packet]]:
+    def __init__(self, self_id, inbox: Optional[List[Packet]] = None, outbox: Optional[List[Tuple[Packet, Node]]] = None) -> None:
+        super().__init__(self_id)
+        self.inbox = deque(inbox or ())  # messages sent to node
+        self.outbox = deque(outbox or ())  # only put in outbox if "successful send"
+
+    def sending_algorithm(self, packet: Packet, neighbors: List[Node]) -> List[Tuple[Packet, int]]:
+        message_id = packet.message.id
+        # nodes on this packet's path, plus every node that has forwarded any packet of the message
+        visited_mask = packet.visited_mask | self.workload.forwarded_by[message_id]
+        sends = []
         for forward_node in neighbors:
             # don't forward packets to nodes that we've already visited
-            if forward_node in packet.nodes_visited:
+            if (visited_mask >> forward_node) & 1:
                 continue
-            # construct a new copy of a packet
-            # forward_packet = copy.copy(packet)
-            forward_packet = Packet(packet.message, packet.ttl)
-            forward_packet.nodes_visited = packet.nodes_visited
-            forward_packet.message.total_cost += 1
-            forward_packet.nodes_visited.append(self.self_id)
-            yield (forward_packet, forward_node)
-        return
\ No newline at end of file
+            # the first send reuses the incoming packet; only further sends need a new copy
+            if sends:
+                # forward_packet = copy.copy(packet)
+                forward_packet = Packet.acquire(packet.message, packet.ttl)
+                forward_packet.visited_mask = packet.visited_mask
+            else:
+                forward_packet = packet
+            sends.append((forward_packet, forward_node))
+        if sends:
+            self.workload.forwarded_by[message_id] |= 1 << self.self_id
+        self.workload.total_cost[message_id] += len(sends)
+        return sends
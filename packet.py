@@ -4,8 +4,45 @@ class Packet:
     '''
     Packet class. The information transmitted between nodes in the network. Wraps around a Message
         object.
+
+        Packets that are no longer in transit can be released to a shared free list and handed out
+        again by acquire, so forwarding doesn't allocate a new Packet for every copy.
     '''
+    _free = []      # Released packets, available for reuse by acquire
+    _max_free = 10000   # Most released packets kept on the free list; further ones are left to the garbage collector
+
+    @classmethod
+    def acquire(cls, msg: Message, ttl=0) -> 'Packet':
+        '''
+        Function: acquire
+            Returns a packet for msg, reusing a released packet if there is one.
+        '''
+        if cls._free:
+            packet = cls._free.pop()
+            packet.reset(msg, ttl)
+            return packet
+        return cls(msg, ttl)
+
     def __init__(self, msg: Message, ttl=0) -> None:
+        self.reset(msg, ttl)
+
+    def reset(self, msg: Message, ttl=0) -> None:
+        '''
+        Function: reset
+            Rebinds the packet to a new message and clears its routing state in place, so the same
+            Packet object can be reused instead of allocating a new one.
+        '''
         self.message = msg      # Message object that is in transit to its destination
-        self.nodes_visited = []     # Nodes the messages has visited, in order
-        self.ttl = ttl      # Whether to use TTL to limit stale packets
\ No newline at end of file
+        self.visited_mask = 0       # Bitmask of the ids of the nodes the message has visited (bit i = node i)
+        self.ttl = ttl      # Whether to use TTL to limit stale packets
+
+    def release(self) -> None:
+        '''
+        Function: release
+            Returns the packet to the free list. The caller must not use the packet afterwards.
+                The free list is capped at Packet._max_free, so a burst of in-flight packets (e.g. a large
+                flood) isn't kept alive for the rest of the process.
+        '''
+        self.message = None     # don't keep the message (and its workload) alive while pooled
+        if len(Packet._free) < Packet._max_free:
+            Packet._free.append(self)
@@ -33,15 +33,20 @@ class Topology(ABC):
         self.density = density 
         self.volatility = volatility 
         self.topology = self.initialize() 
+        self.version = 0    # incremented every time the topology changes (see step)
+        # CSR form of self.topology: the neighbors of node u are indices[indptr[u]:indptr[u+1]]
+        self.indptr = None
+        self.indices = None
+        self._csr_version = None    # version of the topology that indptr/indices were built from
+        self._neighbor_ids = None   # per-node tuples of neighbor ids as Python ints (see get_neighbor_ids)
+        self._neighbor_ids_version = None   # version of the topology that _neighbor_ids was built from
 
-        # consistent layout for non-geographic based topologys
-        G = nx.Graph() 
-        G.add_nodes_from(self.topology[0]) 
-        for i in range(self.num_nodes):
-            for j in range(self.num_nodes):
-                G.add_edge(i,j)
-        self.layout_pos = nx.spring_layout(G)
-        # print(self.layout_pos)
+        # consistent layout for non-geographic based topologys, computed on first display (see get_layout_pos).
+        # Its seed is drawn up front so that displaying doesn't shift the simulation's random stream
+        self._layout_pos = None
+        self._layout_seed = np.random.randint(2**31)
+        self._display_graph = None  # graph drawn by display, updated with only the edges that changed (see get_display_graph)
+        self._display_topology = None   # copy of the topology that _display_graph was last updated to
         # self.fig = plt.figure() 
         self.display_number = 0
         self.display_id = datetime.now()
@@ -62,24 +67,95 @@ class Topology(ABC):
         '''
         pass
 
+    def build_csr(self):
+        '''
+        Function: build_csr
+            Materializes the current adjacency matrix as flat CSR arrays (self.indptr, self.indices),
+                so neighbor queries are a slice of one contiguous array instead of a row scan.
+        '''
+        rows, cols = np.nonzero(self.topology)  # row-major, so each node's neighbors are contiguous
+        self.indptr = np.zeros(self.num_nodes + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=self.num_nodes), out=self.indptr[1:])
+        self.indices = cols.astype(np.int32)
+        self.indices.flags.writeable = False    # neighbor slices are shared by every caller
+        self._csr_version = self.version
+
+    def get_neighbors(self, node_id):
+        '''
+        Function: get_neighbors
+            Returns an array of the ids of the nodes that node_id is connected to, as a read-only
+                view into the CSR arrays. These are rebuilt at most once per topology change.
+        '''
+        if self._csr_version != self.version:
+            self.build_csr()
+        return self.indices[self.indptr[node_id]:self.indptr[node_id + 1]]
+
+    def get_neighbor_ids(self, node_id):
+        '''
+        Function: get_neighbor_ids
+            Same neighbors as get_neighbors, but as a tuple of Python ints. Each node's tuple is built the
+                first time it is asked for after a topology change, so per-packet callers that work with
+                plain ints (e.g. bitmask checks) don't convert an array on every call.
+        '''
+        if self._neighbor_ids_version != self.version:
+            self._neighbor_ids = [None] * self.num_nodes
+            self._neighbor_ids_version = self.version
+        neighbor_ids = self._neighbor_ids[node_id]
+        if neighbor_ids is None:
+            neighbor_ids = tuple(self.get_neighbors(node_id).tolist())
+            self._neighbor_ids[node_id] = neighbor_ids
+        return neighbor_ids
+
+    def get_edges(self):
+        '''
+        Function: get_edges
+            Returns the edges of the network as a list of (i, j) pairs with i < j, one per connected pair of
+                distinct nodes (self-connections are left out).
+        '''
+        rows, cols = np.nonzero(np.triu(self.topology, k=1))
+        return list(zip(rows.tolist(), cols.tolist()))
+
+    def get_display_graph(self):
+        '''
+        Function: get_display_graph
+            Returns the networkx graph of the current topology for display. The graph is built once and
+                afterwards only the edges that changed since the previous call are added or removed.
+        '''
+        if self._display_graph is None:
+            self._display_graph = nx.Graph()
+            self._display_graph.add_nodes_from(range(self.num_nodes))
+            self._display_graph.add_edges_from(self.get_edges())
+            self._display_topology = self.topology.copy()
+            return self._display_graph
+
+        changed = np.triu(self.topology != self._display_topology, k=1)
+        added_rows, added_cols = np.nonzero(changed & self.topology)
+        removed_rows, removed_cols = np.nonzero(changed & self._display_topology)
+        self._display_graph.add_edges_from(zip(added_rows.tolist(), added_cols.tolist()))
+        self._display_graph.remove_edges_from(zip(removed_rows.tolist(), removed_cols.tolist()))
+        np.copyto(self._display_topology, self.topology)
+        return self._display_graph
+
+    def get_layout_pos(self):
+        '''
+        Function: get_layout_pos
+            Returns the node positions used by display: a spring layout of the complete graph, so every
+                display of the topology places the nodes in the same spots. Only topologies that are
+                actually displayed pay for computing it.
+        '''
+        if self._layout_pos is None:
+            self._layout_pos = nx.spring_layout(nx.complete_graph(self.num_nodes), seed=self._layout_seed)
+        return self._layout_pos
+
     def display(self):
         '''
         Function: display
             Visualize the network (nodes and connections).
         '''
-        G = nx.Graph()
-        # add nodes
-        G.add_nodes_from(range(self.num_nodes))
-        # add all edges
-        edges = []
-        for i,row in enumerate(self.topology):
-            for j,val in enumerate(row):
-                # if i>j: break
-                if i==j: continue
-                if val: edges.append((i,j))
-        G.add_edges_from(edges)
+        # nodes and edges, updated from the previous display
+        G = self.get_display_graph()
         # save
-        nx.draw_networkx(G, self.layout_pos)
+        nx.draw_networkx(G, self.get_layout_pos())
         
         ax = plt.gca()
         ax.set_xlim([-1.1,1.1])
@@ -89,7 +165,7 @@ class Topology(ABC):
         if DISPLAY_DEBUG:
             print(self.topology)
             print(f"Number of nodes: {self.num_nodes}")
-            print(f"Edges: {edges}")
+            print(f"Edges: {list(G.edges)}")
             plt.show()
         plt.clf()
         return
@@ -101,6 +177,10 @@ class RandomTopology(Topology):
         as determined by the density and volatility.
     '''
     def __init__(self, num_nodes, density, volatility) -> None:
+        # mask of the entries above the diagonal, i.e. one entry per unordered pair of nodes
+        self._upper_triangle = np.triu(np.ones((num_nodes, num_nodes), dtype=bool), k=1)
+        self._alternate_topology = np.empty((num_nodes, num_nodes), dtype=bool)    # scratch buffer reused by step
+        self._use_alternate = np.empty((num_nodes, num_nodes), dtype=bool)     # scratch buffer reused by step
         super().__init__(num_nodes, density, volatility)
     
     def initialize(self):
@@ -108,24 +188,41 @@ class RandomTopology(Topology):
         Function: initialize
             Initializes network as an Erdős–Rényi-like random graph.
             https://en.wikipedia.org/wiki/Erd%C5%91s%E2%80%93R%C3%A9nyi_model
-        
-            Note: because we are doing the logical or, the edge probability is greater than self.density
-                (In particular, it is 1 - (1-density)^2).
+
+            Each pair of nodes is connected with probability self.density.
         '''
         return self.random_topology(self.density)
     
-    def random_topology(self, p):
+    def random_pair_mask(self, q, out=None):
+        '''
+        Function: random_pair_mask
+            Returns a symmetric boolean mask in which each unordered pair of distinct nodes is set with
+                probability q. One random number is drawn per pair; the diagonal is left unset.
+                If out is given, the mask is written into it instead of a new array.
+        '''
+        num_pairs = self.num_nodes * (self.num_nodes - 1) // 2
+        if out is None:
+            mask = np.zeros((self.num_nodes, self.num_nodes), dtype=bool)
+        else:
+            mask = out
+            mask.fill(False)
+        mask[self._upper_triangle] = np.random.rand(num_pairs) < q
+        mask |= mask.T  # numpy buffers the overlapping transpose, so this is safe in place
+        return mask
+
+    def random_topology(self, p, out=None):
         '''
         Function: random_topology
-            Constructs a random topology based on an Erdős–Rényi graph.
+            Constructs a random topology based on an Erdős–Rényi graph, written into out if it is given.
+
+            Each pair is connected with probability p.
         '''
-        topology = np.random.rand(self.num_nodes, self.num_nodes) < p
-        topology = topology | topology.T
+        topology = self.random_pair_mask(p, out=out)
 
         # This is a bit of a hack to ensure nodes always have one neighbor (themselves)
         # TODO: make nodes not connected to themselves + modify node algorithm
         # to place messages in the node's inbox iff they have no neighbors.
-        topology = topology | np.eye(self.num_nodes, self.num_nodes).astype(np.bool)
+        np.fill_diagonal(topology, True)
         return topology
 
     
@@ -135,12 +232,15 @@ class RandomTopology(Topology):
             Replaces the existing topology with an alternate topology, according to the volatility 
                 and density values.
         '''
-        alternate_topology = self.random_topology(self.density)
-        use_alternate = self.random_topology(self.volatility)
+        alternate_topology = self.random_topology(self.density, out=self._alternate_topology)
+        # each pair is redrawn with probability exactly self.volatility; the mask stays symmetric so the
+        # topology does too, and the diagonal is skipped since both topologies always have it set
+        use_alternate = self.random_pair_mask(self.volatility, out=self._use_alternate)
 
         # Replace the existing topology with an alternate random topology
-        # some fraction of the time (dependent on network volatility)
-        self.topology = np.where(use_alternate, alternate_topology, self.topology)
+        # some fraction of the time (dependent on network volatility), writing into it in place
+        np.copyto(self.topology, alternate_topology, where=use_alternate)
+        self.version += 1
     
 class RandomGeoTopology(Topology):
     '''Connect users based on their location on a grid.
@@ -152,19 +252,20 @@ class RandomGeoTopology(Topology):
     '''
     
     def __init__(self, num_nodes, density, volatility) -> None:
+        max_distance = np.sqrt(2)  # Max distance on 1x1 grid is sqrt(2)
+        self._squared_connect_distance = (density * max_distance) ** 2     # Squared distance within which nodes connect
         super().__init__(num_nodes, density, volatility)
     
     def topology_from_grid_locations(self, grid_locations):
         '''
         Function: topology_from_grid_locations
             Connects nodes if their distance is within self.density * max_distance.
+                Compares squared distances against the squared threshold, so no square roots are taken.
         '''
 
         # Returns ndarray of size [self.num_nodes, self.num_nodes]
-        node_distances = self.get_2d_distances(self.grid_locations)
-        max_distance = np.sqrt(2)  # Max distance on 1x1 grid is sqrt(2)
-        normalized_distances = node_distances / max_distance
-        return normalized_distances < self.density
+        squared_distances = self.get_2d_squared_distances(grid_locations)
+        return squared_distances < self._squared_connect_distance
     
     def random_2d_grid_locations(self, num_nodes):
         '''
@@ -173,13 +274,19 @@ class RandomGeoTopology(Topology):
         '''
         return np.random.uniform(0, 1, size=(num_nodes, 2))
 
-    def get_2d_distances(self, grid_locations):
+    def get_2d_squared_distances(self, grid_locations):
         '''
-        Function: get_2d_distances
-            Computes the L2 norm between locations in the grid.
+        Function: get_2d_squared_distances
+            Computes the squared L2 norm between locations in the grid, one coordinate at a time so
+                that no [num_nodes, num_nodes, 2] difference tensor is materialized.
         '''
-        # This works because None adds an extra dimension, which numpy broadcasts across
-        return np.linalg.norm(grid_locations[:, None, :] - grid_locations[None, :, :], axis=-1)
+        squared_distances = np.zeros((len(grid_locations), len(grid_locations)))
+        for coordinates in grid_locations.T:
+            # This works because None adds an extra dimension, which numpy broadcasts across
+            differences = coordinates[:, None] - coordinates[None, :]
+            differences *= differences
+            squared_distances += differences
+        return squared_distances
 
     def initialize(self):
         '''
@@ -200,28 +307,24 @@ class RandomGeoTopology(Topology):
         alternate_grid_locations = self.random_2d_grid_locations(self.num_nodes)
         # self.grid_locations = (1) * self.grid_locations + self.volatility * alternate_grid_locations
         alternate_grid_locations -= 0.5
-        self.grid_locations = self.grid_locations + self.volatility * (alternate_grid_locations / np.linalg.norm(alternate_grid_locations, ord=2, axis=-1, keepdims=True))
+        # normalize and scale the moves in place, then apply them to the locations without a new array
+        alternate_grid_locations /= np.hypot(alternate_grid_locations[:, 0], alternate_grid_locations[:, 1])[:, None]
+        alternate_grid_locations *= self.volatility
+        self.grid_locations += alternate_grid_locations
         # reflecting across 0 & 1 boundaries to prevent nodes escaping the borders
-        self.grid_locations -= 2 * np.maximum(self.grid_locations-1, 0)
-        self.grid_locations -= 2 * np.minimum(self.grid_locations, 0)
+        # (moves are at most volatility <= 1 long, so one reflection per boundary is enough)
+        np.subtract(2, self.grid_locations, out=self.grid_locations, where=self.grid_locations > 1)
+        np.abs(self.grid_locations, out=self.grid_locations)
         
         self.topology = self.topology_from_grid_locations(self.grid_locations)
+        self.version += 1
 
     def display(self):
         '''
         Function: Visualize the network (nodes and connections).
         '''
-        G = nx.Graph()
-        # add nodes
-        G.add_nodes_from(range(self.num_nodes))
-        # add all edges
-        edges = []
-        for i,row in enumerate(self.topology):
-            for j,val in enumerate(row):
-                # if i>j: break
-                if i==j: continue
-                if val: edges.append((i,j))
-        G.add_edges_from(edges)
+        # nodes and edges, updated from the previous display
+        G = self.get_display_graph()
         # positions
 
         pos = {}
@@ -242,7 +345,7 @@ class RandomGeoTopology(Topology):
             print(f"Grid Location: {self.grid_locations}")
             print(f"Topology: {self.topology}")
             print(f"Number of nodes: {self.num_nodes}")
-            print(f"Edges: {edges}")
+            print(f"Edges: {list(G.edges)}")
             plt.show()
         plt.clf()
         return
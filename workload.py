@@ -1,4 +1,5 @@
-import random
+import numpy as np
+
 from message import Message
 
 class Workload:
@@ -9,6 +10,13 @@ class Workload:
     def __init__(self, num_messages, num_nodes, ttl=None) -> None:
         self.num_messages = num_messages    # Number of messages in the workload
         self.num_nodes = num_nodes      # Number of nodes in the network
+        # Per-message stats, stored as parallel arrays indexed by message id
+        self.total_cost = np.zeros(num_messages, dtype=np.int64)    # Cumulative "hops" per message
+        self.num_packets = np.zeros(num_messages, dtype=np.int64)   # Number of packets per message
+        self.delivered = np.zeros(num_messages, dtype=bool)     # Whether each message has been delivered
+        self.start_ids = np.empty(num_messages, dtype=np.int32)     # Start node id per message (filled by generate_messages)
+        self.destination_ids = np.empty(num_messages, dtype=np.int32)   # Destination node id per message (filled by generate_messages)
+        self.forwarded_by = None    # Bitmask per message of the nodes that have forwarded it, allocated by Node.set_workload for node classes that track it
         self.messages = self.generate_messages()    # Messages that we want to send
         if ttl == None:
             self.ttl = num_nodes    # set TTL to the total number of nodes in the network
@@ -18,22 +26,20 @@ class Workload:
     def generate_messages(self):
         '''
         Function: generate_messages
-            Generates messages with random start and destination.
+            Generates messages with random start and destination, filling in start_ids and destination_ids.
         '''
-        messages = []
-        for i in range(self.num_messages):
-            message = Message(
-                id=i, 
-                start_id=random.randint(0, self.num_nodes-1),
-                destination_id=random.randint(0, self.num_nodes-1)
-            )
-            messages.append(message)
-        return messages
+        # draw every start and destination at once, into the arrays indexed by message id
+        self.start_ids[:] = np.random.randint(0, self.num_nodes, size=self.num_messages)
+        self.destination_ids[:] = np.random.randint(0, self.num_nodes, size=self.num_messages)
+        return [
+            Message(id=i, start_id=start_id, destination_id=destination_id, workload=self)
+            for i, (start_id, destination_id) in enumerate(zip(self.start_ids.tolist(), self.destination_ids.tolist()))
+        ]
     
     def num_delivered(self):
         '''
         Function: num_delivered
             Calculates the total number of messages that were delivered to their end destinations.
         '''
-        return sum(message.delivered for message in self.messages)
+        return int(self.delivered.sum())
     